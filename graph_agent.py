@@ -1,32 +1,113 @@
 import os
 import asyncio
-import subprocess
-import json
-import textwrap
+import hashlib
+import functools
+from pathlib import Path
 from typing import List
 from typing_extensions import TypedDict, NotRequired
+from pydantic import BaseModel
 from langgraph.graph import StateGraph, END
-from langchain_openai import AzureChatOpenAI
 from langchain_core.messages import SystemMessage, HumanMessage
 from dotenv import load_dotenv
-import requests
+from diskcache import Cache
+import orjson
+import aiofiles
 
 try:
-    from ddgs import DDGS
-except ImportError:  # pragma: no cover
-    DDGS = None
+    import uvloop
+except ImportError:  # pragma: no cover (not available on Windows)
+    uvloop = None
 
 # Load environment variables from .env file
 load_dotenv()
 
 # --- 1. CONFIGURATION ---
-llm = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", "https://dfran-m6zqnnwy-eastus2.cognitiveservices.azure.com/"),
-    api_version="2024-12-01-preview",
-    deployment_name="gpt-4o-mini",
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    temperature=0.1
-)
+# Heavy clients/libraries (langchain_openai, ddgs, aiohttp, checkov) are imported on
+# first use so importing this module stays cheap.
+@functools.cache
+def _get_llm():
+    import httpx
+    from langchain_openai import AzureChatOpenAI
+    return AzureChatOpenAI(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", "https://dfran-m6zqnnwy-eastus2.cognitiveservices.azure.com/"),
+        api_version="2024-12-01-preview",
+        deployment_name="gpt-4o-mini",
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        temperature=0.1,
+        # Room for the parallel intel/replan/discovery calls to share warm HTTP/2 connections
+        http_async_client=httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+            http2=True,
+            timeout=httpx.Timeout(60.0, connect=5.0)
+        )
+    )
+
+async def prewarm_llm():
+    """Opens the Azure connection (TLS + HTTP/2) with a 1-token request before the graph needs it."""
+    try:
+        await _get_llm().bind(max_tokens=1).ainvoke([HumanMessage(content="ping")])
+    except Exception as exc:
+        print(f"      ⚠️ LLM prewarm failed: {exc}")
+
+def __getattr__(name):
+    """Keeps `graph_agent.llm` working while deferring client construction (PEP 562)."""
+    if name == "llm":
+        return _get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Completions keyed by prompt + model settings, so retries that resend an
+# identical prompt skip the Azure round trip. Short TTL keeps docs/policies fresh.
+llm_cache = Cache(".llm_cache")
+LLM_CACHE_TTL = 60 * 60
+
+@functools.cache
+def _structured_llm(schema):
+    """LLM constrained to emit `schema` at decode time (built once per schema)."""
+    return _get_llm().with_structured_output(schema)
+
+async def cached_ainvoke(messages, schema=None, use_cache: bool = True, stream: bool = False):
+    """Invokes the LLM, served from llm_cache when possible.
+
+    Returns the response text, or a `schema` instance when a pydantic model is given.
+    `stream` decodes text responses incrementally via llm.astream.
+    """
+    llm = _get_llm()
+    key_parts = [[m.type, m.content] for m in messages] + [
+        llm.temperature, llm.deployment_name, schema.__name__ if schema else None
+    ]
+    key = hashlib.sha256(orjson.dumps(key_parts)).hexdigest()
+    if use_cache:
+        cached = await asyncio.to_thread(llm_cache.get, key)
+        if cached is not None:
+            return schema.model_validate(cached) if schema else cached
+
+    if schema:
+        result = await _structured_llm(schema).ainvoke(messages)
+        value = result.model_dump()
+    elif stream:
+        result = value = "".join([chunk.content async for chunk in llm.astream(messages)])
+    else:
+        result = value = (await llm.ainvoke(messages)).content
+    await asyncio.to_thread(llm_cache.set, key, value, expire=LLM_CACHE_TTL)
+    return result
+
+# Pre-initialized Terraform working directory, reused across every retry so the
+# AWS provider is only downloaded once per process.
+TF_WORKDIR = Path("_tf_workdir")
+TF_WORKDIR.mkdir(exist_ok=True)
+
+VERSIONS_TF = """
+terraform {
+  required_providers {
+    aws = {
+      source  = "hashicorp/aws"
+      version = "~> 5.0"
+    }
+  }
+}
+"""
+
+_tf_init_hash = None  # required_providers hash the workdir was last initialized with
 
 # --- 2. THE SPECIALIST PROMPTS ---
 
@@ -47,6 +128,19 @@ Goal: List the security constraints for the requested infrastructure.
 OUTPUT: A bulleted list of requirements (e.g., "Must have SSE-KMS", "Must block public ACLs").
 """
 
+# Agents A+B fused: one call covering both roles for small requests
+COMBINED_PROMPT = """
+You are both the Terraform Knowledge Base and the Chief Information Security Officer (CISO).
+Goal: Prepare the inputs the architect needs for the requested infrastructure.
+OUTPUT two fields:
+- syntax_guide: A cheat sheet of the EXACT Terraform AWS v5 resource skeletons (not the full code).
+  Emphasize SEPARATE resources for versioning, encryption, and public access blocks.
+- security_policy: A bulleted list of security requirements (e.g., "Must have SSE-KMS", "Must block public ACLs").
+"""
+
+# Requests (plus triage follow-up) longer than this get dedicated researcher and CISO calls
+COMPLEX_REQUEST_CHARS = 300
+
 # Agent C: The Architect
 ARCHITECT_PROMPT = """
 You are a Lead Cloud Architect.
@@ -63,7 +157,7 @@ INSTRUCTIONS:
 TRIAGE_PROMPT = """
 You are the DevOps Site Reliability Engineer on-call.
 You receive Terraform validation or Checkov security failures from downstream tools.
-Analyze the failure and respond in strict JSON with the following keys:
+Analyze the failure and respond with the following fields:
 - summary: short description of root cause.
 - fix_instructions: concrete steps the architect should take to resolve the issue.
 - needs_additional_research: true/false depending on whether we must gather more context (e.g., missing provider, variables, or policies).
@@ -93,12 +187,25 @@ class AgentState(TypedDict):
     next_node: NotRequired[str]            # Routing decision from triage
     documentation_urls: NotRequired[List[str]]
     documentation_snippets: NotRequired[str]
+    cache: NotRequired[bool]               # False makes the architect bypass llm_cache
+
+class IntelPayload(BaseModel):
+    """Researcher and CISO output produced by a single combined call."""
+    syntax_guide: str
+    security_policy: str
+
+class TriageDecision(BaseModel):
+    """Structured verdict returned by the triage agent."""
+    summary: str
+    fix_instructions: str
+    needs_additional_research: bool = False
+    follow_up_prompt: str = ""
+    should_abort: bool = False
 
 # --- 4. DEFINE NODES ---
 
-async def research_agent(state: AgentState):
-    """Async Agent: Fetches syntax rules."""
-    print("   -> 🔎 [Async] Researcher is looking up Terraform v5 docs...")
+def _intel_context(state: AgentState) -> str:
+    """User message shared by the researcher and CISO prompts."""
     request = state.get('request', 'Create infrastructure')
     follow_up = state.get('follow_up_prompt')
     user_content = f"User wants: {request}"
@@ -107,33 +214,47 @@ async def research_agent(state: AgentState):
     doc_snippets = state.get('documentation_snippets')
     if doc_snippets:
         user_content += f"\nDocumentation context:\n{doc_snippets}"
+    return user_content
+
+async def research_agent(state: AgentState):
+    """Async Agent: Fetches syntax rules."""
+    print("   -> 🔎 [Async] Researcher is looking up Terraform v5 docs...")
     msg = [
         SystemMessage(content=RESEARCHER_PROMPT),
-        HumanMessage(content=user_content)
+        HumanMessage(content=_intel_context(state))
     ]
-    response = await llm.ainvoke(msg)
-    return {"syntax_guide": response.content}
+    return {"syntax_guide": await cached_ainvoke(msg)}
 
 async def security_agent(state: AgentState):
     """Async Agent: Fetches security policies."""
     print("   -> 🛡️ [Async] CISO is defining security policies...")
-    request = state.get('request', 'Create infrastructure')
-    follow_up = state.get('follow_up_prompt')
-    user_content = f"User wants: {request}"
-    if follow_up:
-        user_content += f"\nAdditional context from triage: {follow_up}"
-    doc_snippets = state.get('documentation_snippets')
-    if doc_snippets:
-        user_content += f"\nDocumentation context:\n{doc_snippets}"
     msg = [
         SystemMessage(content=SECURITY_PROMPT),
-        HumanMessage(content=user_content)
+        HumanMessage(content=_intel_context(state))
+    ]
+    return {"security_policy": await cached_ainvoke(msg)}
+
+async def combined_agent(state: AgentState):
+    """Single call producing both the syntax guide and the security policy."""
+    print("   -> 🔎🛡️ Researcher + CISO are drafting syntax and policy together...")
+    msg = [
+        SystemMessage(content=COMBINED_PROMPT),
+        HumanMessage(content=_intel_context(state))
     ]
-    response = await llm.ainvoke(msg)
-    return {"security_policy": response.content}
+    payload = await cached_ainvoke(msg, schema=IntelPayload)
+    return {"syntax_guide": payload.syntax_guide, "security_policy": payload.security_policy}
+
+def _is_complex_request(state: AgentState) -> bool:
+    request = state.get('request', '')
+    follow_up = state.get('follow_up_prompt') or ''
+    return len(request) + len(follow_up) > COMPLEX_REQUEST_CHARS
 
 async def intelligence_node(state: AgentState):
-    """Fan-Out Node: Runs Research and Security in PARALLEL."""
+    """Gathers syntax + policy: one fused call, or Research and Security in PARALLEL for complex requests."""
+    if not _is_complex_request(state):
+        print("\n⚡ KICKING OFF COMBINED INTEL AGENT...")
+        return {**await combined_agent(state), "follow_up_prompt": ""}
+
     print("\n⚡ KICKING OFF PARALLEL AGENTS...")
     
     # This is the magic line: It waits for both to finish, but runs them at the same time
@@ -178,15 +299,154 @@ async def architect_node(state: AgentState):
         user_msg += f"\n\n[TRIAGE PLAYBOOK]\n{fix_instructions}"
     
     messages = [SystemMessage(content=ARCHITECT_PROMPT), HumanMessage(content=user_msg)]
-    response = await llm.ainvoke(messages)
+    # Initialize the terraform workdir while the model is still decoding
+    init_task = asyncio.create_task(_prewarm_tf_init())
+    try:
+        content = await cached_ainvoke(messages, use_cache=state.get("cache", True), stream=True)
+    finally:
+        await init_task
     
-    code = response.content.replace("```hcl", "").replace("```", "").strip()
+    code = content.replace("```hcl", "").replace("```", "").strip()
     return {
         "code": code,
         "retry_count": state.get("retry_count", 0) + 1
     }
 
-def tool_node(state: AgentState):
+async def _run(*cmd: str):
+    """Runs a command without blocking the event loop; returns (returncode, stdout, stderr)."""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        proc.kill()
+        raise
+    return proc.returncode, stdout.decode(), stderr.decode()
+
+def _required_providers(code: str) -> str:
+    """Extracts the required_providers block (braces included), or '' if absent."""
+    start = code.find("required_providers")
+    if start == -1:
+        return ""
+    start = code.find("{", start)
+    depth = 0
+    for end in range(start, len(code)):
+        if code[end] == "{":
+            depth += 1
+        elif code[end] == "}":
+            depth -= 1
+            if depth == 0:
+                return code[start:end + 1]
+    return code[start:]
+
+async def _ensure_tf_init(code: str):
+    """Initializes TF_WORKDIR unless it already matches the code's provider set.
+
+    Code without its own required_providers block gets the stub versions.tf.
+    Returns init's stderr on failure, otherwise None.
+    """
+    global _tf_init_hash
+    versions_tf = TF_WORKDIR / "versions.tf"
+    providers = _required_providers(code)
+    if providers:
+        versions_tf.unlink(missing_ok=True)
+    else:
+        async with aiofiles.open(versions_tf, "w") as f:
+            await f.write(VERSIONS_TF)
+        providers = _required_providers(VERSIONS_TF)
+
+    providers_hash = hashlib.sha256(providers.encode()).hexdigest()
+    if providers_hash == _tf_init_hash and (TF_WORKDIR / ".terraform.lock.hcl").exists():
+        return None
+
+    returncode, _, stderr = await _run(
+        "terraform", f"-chdir={TF_WORKDIR}", "init", "-input=false", "-upgrade=false", "-no-color"
+    )
+    if returncode != 0:
+        _tf_init_hash = None
+        return stderr
+    _tf_init_hash = providers_hash
+    return None
+
+async def _prewarm_tf_init():
+    """Best-effort init with the default providers; tool_node reports any real failure."""
+    if _tf_init_hash is not None:
+        return # Already initialized; tool_node re-inits if the new code changes providers
+    # A main.tf left by an earlier attempt or process could clash with the stub versions.tf;
+    # tool_node writes the fresh one before validating anyway
+    (TF_WORKDIR / "main.tf").unlink(missing_ok=True)
+    try:
+        await _ensure_tf_init("")
+    except OSError as exc:
+        print(f"      ⚠️ Terraform prewarm skipped: {exc}")
+
+def _format_diagnostics(output: str) -> str:
+    """Renders `terraform validate -json` diagnostics as one line per finding."""
+    try:
+        diagnostics = orjson.loads(output).get("diagnostics", [])
+    except ValueError:
+        return output
+    lines = []
+    for diag in diagnostics:
+        line = f"{diag.get('severity', 'error')}: {diag.get('summary', '')}"
+        if diag.get("detail"):
+            line += f" - {diag['detail']}"
+        location = diag.get("range")
+        if location:
+            line += f" ({location['filename']}:{location['start']['line']})"
+        lines.append(line)
+    return "\n".join(lines) or output
+
+@functools.cache
+def _checkov_api():
+    """Imports checkov's Terraform runner once, or returns None if checkov is not importable.
+
+    Importing checkov loads its policy registry; each scan then only pays for the scan itself.
+    """
+    try:
+        from checkov.terraform.runner import Runner
+        from checkov.runner_filter import RunnerFilter
+    except ImportError:
+        return None
+    return Runner, RunnerFilter
+
+def _checkov_scan(path: Path):
+    """In-process checkov scan; returns (returncode, output, '') like the CLI."""
+    Runner, RunnerFilter = _checkov_api()
+    report = Runner().run(
+        root_folder=None,
+        files=[str(path)],
+        runner_filter=RunnerFilter(framework=["terraform"])
+    )
+    failures = [
+        f'Check: {record.check_id}: "{record.check_name}"\n'
+        f"\tFAILED for resource: {record.resource}\n"
+        f"\tFile: {record.file_path}:{record.file_line_range[0]}-{record.file_line_range[1]}"
+        for record in report.failed_checks
+    ]
+    return (1 if failures else 0), "\n\n".join(failures), ""
+
+async def _run_checkov():
+    """Security scan; reports a clean pass when checkov is not installed."""
+    main_tf = TF_WORKDIR / "main.tf"
+    if await asyncio.to_thread(_checkov_api) is not None:
+        try:
+            return await asyncio.to_thread(_checkov_scan, main_tf)
+        except Exception as exc:
+            print(f"      ⚠️ In-process checkov failed ({exc}); falling back to the CLI.")
+    try:
+        return await _run("checkov", "-f", str(main_tf), "--quiet", "--compact")
+    except FileNotFoundError:
+        return 0, "", "" # Skip if checkov missing
+
+def _worth_scanning(code: str) -> bool:
+    """Cheap structural check: unbalanced braces or no resources means checkov can wait for validate."""
+    return code.count("{") == code.count("}") and 'resource "' in code
+
+async def tool_node(state: AgentState):
     """Validator: Runs Terraform & Checkov."""
     retry_count = state.get("retry_count", 0)
     print(f"   -> 🛠️ Validating Code (Attempt {retry_count})...")
@@ -195,27 +455,70 @@ def tool_node(state: AgentState):
     if not code:
         return {"error": "No code generated", "status": "failed"}
     
-    with open("main.tf", "w") as f:
-        f.write(code)
+    async with aiofiles.open(TF_WORKDIR / "main.tf", "w") as f:
+        await f.write(code)
 
-    # 1. Syntax Check
-    try:
-        subprocess.run(["terraform", "init"], check=True, capture_output=True)
-        subprocess.run(["terraform", "validate"], check=True, capture_output=True)
-    except subprocess.CalledProcessError as e:
-        return {"error": f"Syntax Error: {e.stderr.decode()}", "status": "failed"}
+    # 1. Syntax Check (init only re-runs when the provider set changes)
+    init_error = await _ensure_tf_init(code)
+    if init_error:
+        return {"error": f"Syntax Error: {init_error}", "status": "failed"}
 
-    # 2. Security Check
-    try:
-        proc = subprocess.run(["checkov", "-f", "main.tf", "--quiet", "--compact"], capture_output=True, text=True)
-        if proc.returncode != 0:
-            return {"error": f"Security Violations: {proc.stdout}", "status": "failed"}
-    except FileNotFoundError:
-        pass # Skip if checkov missing
+    # 2. Validate and Security Check in parallel - checkov only reads main.tf
+    validate_task = asyncio.create_task(
+        _run("terraform", f"-chdir={TF_WORKDIR}", "validate", "-no-color", "-json")
+    )
+    checkov_task = asyncio.create_task(_run_checkov()) if _worth_scanning(code) else None
+
+    # A failed validate makes the checkov result worthless - stop waiting for it
+    validate = await validate_task
+    if validate[0] != 0:
+        if checkov_task:
+            checkov_task.cancel()
+        return {
+            "error": f"Syntax Error: {_format_diagnostics(validate[1])}",
+            "status": "failed"
+        }
+
+    # The pre-check only guards against unparseable HCL; valid code always gets scanned
+    if checkov_task is None:
+        checkov_task = asyncio.create_task(_run_checkov())
+
+    checkov = await checkov_task
+    if checkov[0] != 0:
+        return {"error": f"Security Violations: {checkov[1]}", "status": "failed"}
 
     return {"error": None, "status": "success"}
 
-def discovery_node(state: AgentState):
+def _ddgs_search(ddgs_cls, query: str):
+    """Blocking DuckDuckGo search; run it via asyncio.to_thread."""
+    with ddgs_cls() as ddgs:
+        return list(ddgs.text(query, max_results=8))
+
+# Only the first 64KB of a doc page is read; the main content sits well inside it
+DOC_PAGE_MAX_BYTES = 64 * 1024
+
+async def _fetch_snippet(session, url: str):
+    """Downloads one doc page and returns a prompt-sized snippet of its main text."""
+    from selectolax.lexbor import LexborHTMLParser
+
+    async with session.get(url) as resp:
+        if resp.status != 200:
+            return None
+        body = bytearray()
+        async for chunk in resp.content.iter_chunked(16 * 1024):
+            body += chunk
+            if len(body) >= DOC_PAGE_MAX_BYTES:
+                break
+        html = bytes(body[:DOC_PAGE_MAX_BYTES]).decode(resp.charset or "utf-8", errors="replace")
+
+    # Strip scripts/CSS/nav before truncating so the budget goes to actual docs
+    tree = LexborHTMLParser(html)
+    tree.strip_tags(["script", "style", "noscript", "nav"])
+    node = tree.css_first("main") or tree.css_first("article") or tree.body
+    text = node.text(separator=" ", strip=True) if node else ""
+    return text[:2500] or None
+
+async def discovery_node(state: AgentState):
     """Retrieves fresh Terraform documentation context."""
     request = state.get("request", "terraform aws resource")
     print("   -> 🌐 Discovery agent is searching Terraform docs...")
@@ -225,27 +528,37 @@ def discovery_node(state: AgentState):
 
     query = f"site:registry.terraform.io {request}"
 
+    try:
+        from ddgs import DDGS
+    except ImportError:  # pragma: no cover
+        DDGS = None
+
     if DDGS is None:
         print("      ⚠️ Install duckduckgo_search for live discovery (pip install duckduckgo-search)")
     else:  # pragma: no cover (network dependant)
+        import aiohttp
         try:
-            with DDGS() as ddgs:
-                for result in ddgs.text(query, max_results=8):
-                    url = result.get("href")
-                    if not url or "registry.terraform.io" not in url:
-                        continue
-                    if url in urls:
-                        continue
-                    urls.append(url)
-                    try:
-                        resp = requests.get(url, timeout=10)
-                        if resp.ok:
-                            snippet = textwrap.shorten(resp.text, width=2500, placeholder="...")
-                            snippets.append(f"URL: {url}\n{snippet}")
-                    except requests.RequestException:
-                        continue
-                    if len(urls) >= 3:
-                        break
+            results = await asyncio.to_thread(_ddgs_search, DDGS, query)
+            for result in results:
+                url = result.get("href")
+                if not url or "registry.terraform.io" not in url:
+                    continue
+                if url in urls:
+                    continue
+                urls.append(url)
+                if len(urls) >= 3:
+                    break
+
+            # Fetch every candidate page at once instead of one timeout after another
+            timeout = aiohttp.ClientTimeout(total=10)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                pages = await asyncio.gather(
+                    *(_fetch_snippet(session, url) for url in urls),
+                    return_exceptions=True
+                )
+            for url, page in zip(urls, pages):
+                if isinstance(page, str):
+                    snippets.append(f"URL: {url}\n{page}")
         except Exception as exc:
             print(f"      ⚠️ Discovery lookup failed: {exc}")
 
@@ -257,8 +570,8 @@ def discovery_node(state: AgentState):
             HumanMessage(content=combined)
         ]
         try:
-            summary = llm.invoke(messages)
-            doc_summary = summary.content.strip()
+            summary = await cached_ainvoke(messages)
+            doc_summary = summary.strip()
         except Exception as exc:
             print(f"      ⚠️ Discovery summarization failed: {exc}")
             doc_summary = combined
@@ -285,43 +598,46 @@ async def triage_node(state: AgentState):
 
     messages = [
         SystemMessage(content=TRIAGE_PROMPT),
-        HumanMessage(content=json.dumps(payload))
+        HumanMessage(content=orjson.dumps(payload).decode())
     ]
 
-    response = await llm.ainvoke(messages)
-    raw = response.content.strip()
-
-    try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
-        data = {
-            "summary": raw,
-            "fix_instructions": raw,
-            "needs_additional_research": False,
-            "follow_up_prompt": "",
-            "should_abort": False
-        }
+    data = await cached_ainvoke(messages, schema=TriageDecision)
 
-    needs_research = bool(data.get("needs_additional_research"))
-    should_abort = bool(data.get("should_abort"))
+    needs_research = data.needs_additional_research
+    should_abort = data.should_abort
 
     if should_abort:
         next_node = "end"
     elif needs_research:
-        next_node = "discovery"
+        next_node = "replan"
     else:
         next_node = "architect"
 
     status = "aborted" if next_node == "end" else "retry"
 
     return {
-        "diagnosis": data.get("summary", ""),
-        "fix_instructions": data.get("fix_instructions", ""),
-        "follow_up_prompt": data.get("follow_up_prompt", ""),
+        "diagnosis": data.summary,
+        "fix_instructions": data.fix_instructions,
+        "follow_up_prompt": data.follow_up_prompt,
         "next_node": next_node,
-        "status": status
+        "status": status,
+        # A retry resends the same architect inputs; a cached answer would repeat the failed code
+        "cache": False
     }
 
+async def replan_node(state: AgentState):
+    """Re-research path: new discovery runs alongside the CISO, who reuses the docs already gathered."""
+    print("\n⚡ REPLANNING: discovery and CISO in parallel...")
+    docs, security = await asyncio.gather(
+        discovery_node(state),
+        security_agent(state)
+    )
+
+    # The researcher needs the fresh docs, so it runs once discovery is done
+    research = await research_agent({**state, **docs})
+
+    return {**docs, **research, **security, "follow_up_prompt": ""}
+
 # --- 5. LOGIC EDGES ---
 
 def decide_after_tool(state: AgentState):
@@ -339,9 +655,9 @@ def decide_after_tool(state: AgentState):
 
 def decide_after_triage(state: AgentState):
     next_node = state.get("next_node", "architect")
-    if next_node not in {"architect", "intelligence", "end", "discovery"}:
+    if next_node not in {"architect", "intelligence", "end", "replan"}:
         next_node = "architect"
-    if next_node == "discovery":
+    if next_node == "replan":
         print("   -> ♻️ Triage requested broader discovery to gather new docs.")
     elif next_node == "intelligence":
         print("   -> 🔁 Triage wants existing intel agents to re-run with new context.")
@@ -351,6 +667,13 @@ def decide_after_triage(state: AgentState):
         print("   -> 🧯 Triage decided to halt automation.")
     return next_node
 
+def route_entry(state: AgentState):
+    """Skips discovery when docs were restored from a previous run's checkpoint."""
+    if state.get("documentation_snippets"):
+        print("   -> 💾 Reusing documentation saved by a previous run.")
+        return "intelligence"
+    return "discovery"
+
 # --- 6. BUILD GRAPH ---
 workflow = StateGraph(AgentState)
 
@@ -360,12 +683,20 @@ workflow.add_node("intelligence", intelligence_node)
 workflow.add_node("architect", architect_node)
 workflow.add_node("tool", tool_node)
 workflow.add_node("triage", triage_node)
+workflow.add_node("replan", replan_node)
 
 # Linear flow with discovery in front (intelligence still parallel inside)
-workflow.set_entry_point("discovery")
+workflow.set_conditional_entry_point(
+    route_entry,
+    {
+        "discovery": "discovery",
+        "intelligence": "intelligence"
+    }
+)
 workflow.add_edge("discovery", "intelligence")
 workflow.add_edge("intelligence", "architect")
 workflow.add_edge("architect", "tool")
+workflow.add_edge("replan", "architect")
 workflow.add_conditional_edges(
     "tool",
     decide_after_tool,
@@ -380,7 +711,7 @@ workflow.add_conditional_edges(
     "triage",
     decide_after_triage,
     {
-        "discovery": "discovery",
+        "replan": "replan",
         "intelligence": "intelligence",
         "architect": "architect",
         "end": END
@@ -390,10 +721,18 @@ workflow.add_conditional_edges(
 app = workflow.compile()
 
 # --- 7. RUNNER ---
+# Checkpoints for `python graph_agent.py` runs; `langgraph dev` brings its own persistence
+CHECKPOINT_DB = ".langgraph.db"
+
 async def main():
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
     print("🚀 Starting Multi-Agent Async Graph...")
+    # Handshake with Azure while discovery is still searching
+    prewarm_task = asyncio.create_task(prewarm_llm())
+    request = "Create an AWS S3 bucket named 'kanu-async-demo'"
     initial_state = {
-        "request": "Create an AWS S3 bucket named 'kanu-async-demo'",
+        "request": request,
         "messages": [],
         "syntax_guide": "",
         "security_policy": "",
@@ -402,11 +741,36 @@ async def main():
         "documentation_urls": [],
         "documentation_snippets": "",
         "retry_count": 0,
-        "status": "running"
+        "status": "running",
+        # Reset triage output a previous run on this thread may have left behind
+        "diagnosis": "",
+        "fix_instructions": "",
+        "follow_up_prompt": "",
+        "cache": True
     }
-    
-    # We use 'await' here because the graph is now async
-    result = await app.ainvoke(initial_state)
+
+    # One checkpoint thread per request, so repeating a request can reuse its last run
+    config = {"configurable": {"thread_id": hashlib.sha1(request.encode()).hexdigest()}}
+
+    try:
+        async with AsyncSqliteSaver.from_conn_string(CHECKPOINT_DB) as memory:
+            graph = workflow.compile(checkpointer=memory)
+            snapshot = await graph.aget_state(config)
+
+            # We use 'await' here because the graph is now async
+            if snapshot.next:
+                print("💾 Resuming interrupted run from its last checkpoint...")
+                result = await graph.ainvoke(None, config)
+            else:
+                saved = snapshot.values
+                initial_state["documentation_urls"] = saved.get("documentation_urls", [])
+                initial_state["documentation_snippets"] = saved.get("documentation_snippets", "")
+                result = await graph.ainvoke(initial_state, config)
+    finally:
+        # Once the graph has returned or raised, the warm-up is no longer useful
+        if not prewarm_task.done():
+            prewarm_task.cancel()
+        await asyncio.gather(prewarm_task, return_exceptions=True)
     
     print("\nFINAL ARCHITECTURE GENERATED:")
     print("=" * 40)
@@ -414,4 +778,6 @@ async def main():
     print("=" * 40)
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # uvloop's libuv loop has cheaper wakeups for all the concurrent I/O; asyncio is the fallback
+    runner = uvloop.run if uvloop is not None else asyncio.run
+    runner(main())
\ No newline at end of file
@@ -1,25 +1,34 @@
-import subprocess
+import asyncio
 import os
-from openai import AzureOpenAI
+import tempfile
+from collections import OrderedDict
+from openai import AsyncAzureOpenAI
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover (not available on Windows)
+    uvloop = None
 
 # 1. Setup - Read config.txt
+# Lines are `KEY:value` or `KEY=value`; whichever separator comes first splits the line.
 with open("config.txt", "r") as f:
-    lines = f.read().strip().split("\n")
-    for line in lines:
-        if line.startswith("API_KEY:"):
-            subscription_key = line.split("API_KEY:")[1]
-        elif line.startswith("LANGCHAIN_API_KEY:"):
-            os.environ["LANGCHAIN_API_KEY"] = line.split("LANGCHAIN_API_KEY:")[1]
-        elif "LANGCHAIN_TRACING_V2" in line:
-            os.environ["LANGCHAIN_TRACING_V2"] = "true"
-        elif "LANGCHAIN_PROJECT" in line:
-            os.environ["LANGCHAIN_PROJECT"] = line.split("=")[1]
+    config = {
+        key.strip(): value.strip()
+        for key, value in (
+            line.split(":", 1) if ":" in line.split("=", 1)[0] else line.split("=", 1)
+            for line in f.read().splitlines()
+            if ":" in line or "=" in line
+        )
+    }
+
+subscription_key = config["API_KEY"]
+os.environ.update({k: v for k, v in config.items() if k.startswith("LANGCHAIN_")})
 
 # Initialize Azure OpenAI Client
 endpoint = "https://dfran-m6zqnnwy-eastus2.cognitiveservices.azure.com/"
 api_version = "2024-12-01-preview"
 
-client = AzureOpenAI(
+client = AsyncAzureOpenAI(
     api_version=api_version,
     azure_endpoint=endpoint,
     api_key=subscription_key
@@ -35,40 +44,83 @@ CRITICAL RULES:
 3. If you get a SECURITY ERROR (Checkov), fix it by adding the required separate resources (like aws_s3_bucket_server_side_encryption_configuration).
 """
 
+DEFAULT_TEMPERATURE = 0.1
+# Used when an error the agent already tried to fix comes back, to break the loop
+OSCILLATION_TEMPERATURE = 0.3
+
+# (user_prompt, error_context) -> code. Repeat runs of a request reuse these fixes
+# without an API call; when an error comes back within a run, the fix that didn't
+# hold is looked up here and shown to the model so it tries something else.
+CODE_CACHE_SIZE = 64
+_code_cache = OrderedDict()
+
+# Shared provider cache so batched agents (each in its own scratch dir) don't all
+# download the AWS provider. Scratch dirs start without a lock file, so terraform
+# must be allowed to use cached plugins that aren't recorded in one yet.
+TF_PLUGIN_CACHE_DIR = os.path.abspath(os.environ.get("TF_PLUGIN_CACHE_DIR", ".tf_plugin_cache"))
+os.makedirs(TF_PLUGIN_CACHE_DIR, exist_ok=True)
+TF_ENV = {
+    **os.environ,
+    "TF_PLUGIN_CACHE_DIR": TF_PLUGIN_CACHE_DIR,
+    "TF_PLUGIN_CACHE_MAY_BREAK_DEPENDENCY_LOCK_FILE": "true"
+}
+
+# The plugin cache isn't safe for concurrent writers; the first init fills it, the rest link from it
+_tf_init_lock = asyncio.Lock()
+
 def write_file(filename, content):
     with open(filename, "w") as f:
         f.write(content)
 
-def run_terraform_validate():
-    """Runs terraform validate."""
-    try:
-        subprocess.run(["terraform", "init"], check=True, capture_output=True)
-        result = subprocess.run(["terraform", "validate"], check=True, capture_output=True, text=True)
-        return True, "✅ Terraform Syntax Valid."
-    except subprocess.CalledProcessError as e:
-        return False, f"Terraform Syntax Error:\n{e.stderr}"
+async def run_command(*cmd, cwd="."):
+    """Runs a command without blocking the event loop; returns (returncode, stdout, stderr)."""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        cwd=cwd,
+        env=TF_ENV,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    return proc.returncode, stdout.decode(), stderr.decode()
 
-def run_security_scan():
+async def run_terraform_validate(workdir="."):
+    """Runs terraform validate."""
+    async with _tf_init_lock:
+        returncode, _, stderr = await run_command("terraform", "init", "-input=false", cwd=workdir)
+    if returncode == 0:
+        returncode, _, stderr = await run_command("terraform", "validate", cwd=workdir)
+    if returncode != 0:
+        return False, f"Terraform Syntax Error:\n{stderr}"
+    return True, "✅ Terraform Syntax Valid."
+
+async def run_security_scan(workdir="."):
     """Runs Checkov security scan."""
     print("   -> 🛡️ Running Security Scan (Checkov)...")
     try:
         # We use --quiet to just get the failures, and --compact to save tokens
-        result = subprocess.run(
-            ["checkov", "-f", "main.tf", "--quiet", "--compact"], 
-            capture_output=True, text=True
+        returncode, stdout, _ = await run_command(
+            "checkov", "-f", "main.tf", "--quiet", "--compact", cwd=workdir
         )
         
         # Checkov returns 0 for pass, 1 for fail
-        if result.returncode == 0:
+        if returncode == 0:
             return True, "✅ Security Checks Passed."
         else:
             # We capture the output (the security warnings)
-            return False, f"Security Violations Found:\n{result.stdout}"
+            return False, f"Security Violations Found:\n{stdout}"
             
     except FileNotFoundError:
         return True, "⚠️ Checkov not installed. Skipping security scan."
 
-def generate_code(user_prompt, error_context=None):
+async def generate_code(user_prompt, error_context=None, temperature=DEFAULT_TEMPERATURE):
+    # Only default-temperature answers are cached; a raised temperature asks for something new
+    key = (user_prompt, error_context)
+    if temperature == DEFAULT_TEMPERATURE and key in _code_cache:
+        _code_cache.move_to_end(key)
+        print("   -> ♻️ Cache hit: reusing the code generated for this exact error.")
+        return _code_cache[key]
+
     messages = [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": user_prompt}
@@ -80,17 +132,47 @@ def generate_code(user_prompt, error_context=None):
             "content": f"The code failed validation. Fix it based on this error:\n{error_context}"
         })
 
-    response = client.chat.completions.create(
+    response = await client.chat.completions.create(
         model="gpt-4o-mini", # Using your cheap/fast model
         messages=messages,
-        temperature=0.1 
+        temperature=temperature
     )
-    return response.choices[0].message.content.replace("```hcl", "").replace("```", "").strip()
+    code = response.choices[0].message.content.replace("```hcl", "").replace("```", "").strip()
+
+    if temperature == DEFAULT_TEMPERATURE:
+        _code_cache[key] = code
+        if len(_code_cache) > CODE_CACHE_SIZE:
+            _code_cache.popitem(last=False)
+    return code
+
+async def generate_many(prompts):
+    """Generates first-draft code for independent prompts with concurrent completions."""
+    return await asyncio.gather(*(generate_code(prompt) for prompt in prompts))
+
+async def fix_code(user_request, error_msg, seen_errors):
+    """Regenerates code for an error; a returning error gets a hotter, hinted retry."""
+    error_prefix = error_msg[:200]
+    if error_prefix not in seen_errors:
+        seen_errors.add(error_prefix)
+        return await generate_code(user_request, error_context=error_msg)
+
+    error_context = error_msg
+    previous_fix = _code_cache.get((user_request, error_msg))
+    if previous_fix is not None:
+        print("   -> ♻️ Cache hit: found the earlier fix for this error; telling the agent it didn't hold.")
+        error_context += (
+            "\n\nThis fix was already tried for this exact error and the error came back:\n"
+            f"{previous_fix}\nTake a different approach."
+        )
+    print(f"   -> 🔁 Error seen before; retrying at temperature {OSCILLATION_TEMPERATURE} to break the loop.")
+    return await generate_code(user_request, error_context=error_context, temperature=OSCILLATION_TEMPERATURE)
 
-def run_agent(user_request):
+async def run_agent(user_request, workdir=".", initial_code=None):
     print(f"🚀 Starting Agent with request: '{user_request}'")
-    code = generate_code(user_request)
-    write_file("main.tf", code)
+    main_tf = os.path.join(workdir, "main.tf")
+    code = initial_code if initial_code is not None else await generate_code(user_request)
+    write_file(main_tf, code)
+    seen_errors = set()
 
     # Retry Loop
     MAX_RETRIES = 5
@@ -98,23 +180,23 @@ def run_agent(user_request):
         print(f"\n--- Attempt {attempt + 1} ---")
         
         # 1. Check Syntax
-        syntax_pass, syntax_msg = run_terraform_validate()
+        syntax_pass, syntax_msg = await run_terraform_validate(workdir)
         
         if not syntax_pass:
             print(f"❌ {syntax_msg}")
             print("   -> Agent is fixing syntax...")
-            code = generate_code(user_request, error_context=syntax_msg)
-            write_file("main.tf", code)
+            code = await fix_code(user_request, syntax_msg, seen_errors)
+            write_file(main_tf, code)
             continue # Try next attempt
 
         # 2. Check Security (Only if syntax passes)
-        sec_pass, sec_msg = run_security_scan()
+        sec_pass, sec_msg = await run_security_scan(workdir)
         
         if not sec_pass:
             print(f"❌ {sec_msg}")
             print("   -> Agent is fixing security vulnerabilities...")
-            code = generate_code(user_request, error_context=sec_msg)
-            write_file("main.tf", code)
+            code = await fix_code(user_request, sec_msg, seen_errors)
+            write_file(main_tf, code)
             continue # Try next attempt
 
         # 3. If both pass
@@ -127,7 +209,25 @@ def run_agent(user_request):
     print("💀 Failed to generate valid code after max retries.")
     return False
 
+async def run_agents(user_requests):
+    """Runs several agents concurrently.
+
+    All first drafts are requested up front via generate_many. A single request
+    writes main.tf to the current directory like run_agent; a batch gives each
+    agent its own scratch directory so they don't clobber each other.
+    """
+    drafts = await generate_many(user_requests)
+    if len(user_requests) == 1:
+        return [await run_agent(user_requests[0], initial_code=drafts[0])]
+
+    async def run_isolated(user_request, draft):
+        with tempfile.TemporaryDirectory() as workdir:
+            return await run_agent(user_request, workdir, initial_code=draft)
+
+    return await asyncio.gather(*(run_isolated(r, d) for r, d in zip(user_requests, drafts)))
+
 if __name__ == "__main__":
     # THE SECURITY TRAP: Ask for a bucket, but don't ask for encryption.
     # Checkov should scream that it's unencrypted, and the agent should fix it.
-    run_agent("Create an AWS S3 bucket named 'kanu-secure-demo'")
\ No newline at end of file
+    runner = uvloop.run if uvloop is not None else asyncio.run
+    runner(run_agents(["Create an AWS S3 bucket named 'kanu-secure-demo'"]))
\ No newline at end of file